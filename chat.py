@@ -1,185 +1,611 @@
 import socket
-import threading
-import json
+import contextlib
+import errno
 import os
+import selectors
+import signal
+import struct
+import sys
 import time
 
-CONFIG_FILE = "chat_config.json"
+CONFIG_FILE = "chat_config.txt"
 PORT = 5000  # Fixed port for both listening and connecting
+EXIT_SEND_TIMEOUT = 2  # Seconds to wait for queued data to go out on exit
 
-# Shared variables to hold the chat connection and signal when it’s ready.
-chat_conn = None
-chat_conn_lock = threading.Lock()
-connection_established = threading.Event()
+CONNECT_TIMEOUT = 60  # Seconds to wait for the partner before giving up
+# Delay between failed connection attempts: starts small, doubles up to the cap.
+RETRY_DELAY_MIN = 0.001
+RETRY_DELAY_MAX = 0.25
+# connect_ex() results meaning the attempt succeeded or is still in progress.
+CONNECT_OK_ERRNOS = (
+    0,
+    errno.EISCONN,
+    errno.EINPROGRESS,
+    errno.EALREADY,
+    errno.EWOULDBLOCK,
+)
+RECV_SIZE = 65536  # Maximum bytes read per recv() call
+STDIN_READ_SIZE = 4096  # Maximum bytes of user input read at once
+
+# Every message is framed as a 1-byte type tag and a 4-byte payload length.
+FRAME_HEADER = struct.Struct("!BI")
+MSG_TEXT = 0  # Payload is a chat line ("name: message")
+MSG_EXIT = 1  # Sender has left the chat; no payload
+MAX_FRAME_SIZE = 1 << 20  # Largest payload accepted from (or sent to) the partner
+EXIT_FRAME = FRAME_HEADER.pack(MSG_EXIT, 0)
+EXIT_COMMAND = b"exit()"  # Typed by the user to leave the chat
+EXIT_SIGNALS = (signal.SIGINT, signal.SIGTERM)  # Also leave the chat cleanly
+
+# Explicit SO_RCVBUF/SO_SNDBUF size in bytes (e.g. 131072). Left unset, the
+# kernel's TCP buffer autotuning stays in charge, which is usually better.
+SOCKET_BUFFER_SIZE = int(os.environ.get("CHAT_SOCKET_BUFFER", "0"))
+
+# CPU to pin the chat loop to (Linux): a CPU number, or "auto" for the CPU the
+# kernel reports handling the connection's packets. Unset leaves scheduling alone.
+PIN_CPU = os.environ.get("CHAT_CPU", "")
+
+# Last configuration read from or written to CONFIG_FILE.
+_CONFIG_CACHE = None
 
 
 def load_config():
-    """Load saved partner configuration (name and IP) if available."""
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, "r") as f:
-                return json.load(f)
-        except Exception as e:
-            print("Error reading configuration file:", e)
-            return None
-    return None
+    """
+    Load saved partner configuration (name and IP) if available.
+    CONFIG_FILE holds the partner's name on the first line and IP on the second.
+    """
+    global _CONFIG_CACHE
+    if _CONFIG_CACHE is not None:
+        return _CONFIG_CACHE
+    try:
+        with open(CONFIG_FILE, "r") as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print("Error reading configuration file:", e)
+        return None
+    if len(lines) < 2:
+        print("Error reading configuration file: expected a name and an IP line.")
+        return None
+    _CONFIG_CACHE = dict(zip(("partner_name", "partner_ip"), lines))
+    return _CONFIG_CACHE
 
 
-def save_config(partner_name, partner_ip):
-    """Save partner configuration for future sessions with duplicacy check."""
+def save_config(partner_name, partner_ip, cached=None):
+    """
+    Save partner configuration for future sessions with duplicacy check.
+    The check compares against `cached` (the configuration loaded by the
+    caller) or else the last configuration loaded or saved, never re-reading
+    the file. The new file is written under a temporary name and renamed over
+    CONFIG_FILE, so an interrupted save cannot leave it half-written.
+    """
+    global _CONFIG_CACHE
     config = {"partner_name": partner_name, "partner_ip": partner_ip}
+    known = cached if cached is not None else _CONFIG_CACHE
+    if (
+        known is not None
+        and known.get("partner_name") == partner_name
+        and known.get("partner_ip") == partner_ip
+    ):
+        print("Configuration already saved, no update needed.")
+        return
+    tmp_file = CONFIG_FILE + ".tmp"
     try:
-        # Check for duplicacy: if the file exists and the same config is saved, do nothing.
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, "r") as f:
-                try:
-                    existing_config = json.load(f)
-                    if (
-                        existing_config.get("partner_name") == partner_name
-                        and existing_config.get("partner_ip") == partner_ip
-                    ):
-                        print("Configuration already saved, no update needed.")
-                        return
-                except json.JSONDecodeError:
-                    # If file is corrupted, we'll overwrite it.
-                    pass
-        with open(CONFIG_FILE, "w") as f:
-            json.dump(config, f)
+        with open(tmp_file, "w") as f:
+            f.write(f"{partner_name}\n{partner_ip}\n")
+        os.replace(tmp_file, CONFIG_FILE)
+        _CONFIG_CACHE = config
         print("Configuration saved successfully.")
     except Exception as e:
         print("Error saving configuration:", e)
 
 
-def server_thread_func():
+def tune_buffers(sock):
+    """Applies the CHAT_SOCKET_BUFFER size to the socket's kernel buffers, if set."""
+    if SOCKET_BUFFER_SIZE:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+
+
+def pin_to_cpu(sock):
+    """
+    Pins the process to the CPU chosen by CHAT_CPU. With "auto" that is the
+    CPU that last processed the connection's incoming packets; a number is
+    used as given and does not change where the kernel handles packets.
+    """
+    if not PIN_CPU or not hasattr(os, "sched_setaffinity"):
+        return
+    try:
+        if PIN_CPU == "auto":
+            cpu = sock.getsockopt(socket.SOL_SOCKET, socket.SO_INCOMING_CPU)
+        else:
+            cpu = int(PIN_CPU)
+        os.sched_setaffinity(0, {cpu})
+        print(f"Pinned chat to CPU {cpu}.")
+    except (AttributeError, OSError, ValueError) as e:
+        print(f"Could not pin chat to CPU {PIN_CPU}: {e}")
+
+
+def share_port(sock):
     """
-    Listens for an incoming connection on PORT.
-    When a connection is accepted, if no connection has been established yet,
-    it saves the connection and signals that the chat can begin.
+    Marks the socket so it can bind PORT alongside the other sockets of this
+    app. SO_REUSEPORT also allows a quick rebind after a restart.
+    """
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, "SO_REUSEPORT"):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+
+def open_listener():
+    """
+    Creates a non-blocking socket listening for an incoming connection on PORT.
+    Returns None if the port cannot be bound.
     """
-    global chat_conn
     server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    share_port(server_sock)
+    # Set before listen() so accepted connections inherit the buffer sizes.
+    tune_buffers(server_sock)
     try:
         server_sock.bind(("", PORT))
         server_sock.listen(1)
     except Exception as e:
         print(f"[Listener] Failed to bind/listen on port {PORT}: {e}")
-        return
-
-    # Set a timeout so we can periodically check if a connection is already made
-    server_sock.settimeout(1)
+        server_sock.close()
+        return None
+    server_sock.setblocking(False)
     print(f"[Listener] Listening for incoming connections on port {PORT}...")
+    return server_sock
+
+
+def _connect_ex(s, partner_ip):
+    """Starts a non-blocking connect to the partner and returns its errno."""
+    try:
+        return s.connect_ex((partner_ip, PORT))
+    except OSError:
+        # e.g. an address that cannot be resolved; treat as a failed attempt.
+        return errno.EINVAL
 
-    while not connection_established.is_set():
+
+def start_connect(partner_ip, s=None):
+    """
+    Starts a non-blocking connection attempt from PORT to the partner's IP on PORT.
+    The socket becomes writable once the attempt completes (or fails).
+    `s` may be the socket of a previous failed attempt: Linux lets it connect
+    again, which saves allocating a new descriptor on every retry. Where the
+    platform refuses, a fresh socket is used instead.
+    Returns None if the attempt could not even be started.
+    """
+    if s is not None:
+        err = _connect_ex(s, partner_ip)
+        if err == errno.ECONNABORTED:
+            # Linux answers the first connect() after a refused attempt with
+            # ECONNABORTED while resetting the socket; the next one starts over.
+            err = _connect_ex(s, partner_ip)
+        if err in CONNECT_OK_ERRNOS:
+            return s
+        s.close()
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    tune_buffers(s)
+    if hasattr(socket, "SO_REUSEPORT"):
+        # Connect from PORT too, so both peers always meet on the same pair of
+        # addresses: if they dial at the same moment the SYNs cross and TCP
+        # simultaneous open joins them into one connection, otherwise the
+        # partner's listener accepts it. The partner's own attempt then fails
+        # instead of opening a second, redundant connection.
+        share_port(s)
         try:
-            conn, addr = server_sock.accept()
-            with chat_conn_lock:
-                if chat_conn is None:
+            s.bind(("", PORT))
+        except OSError:
+            pass  # Fall back to an ephemeral source port.
+    s.setblocking(False)
+    if _connect_ex(s, partner_ip) in CONNECT_OK_ERRNOS:
+        return s
+    s.close()
+    return None
+
+
+def establish_connection(sel, partner_ip, timeout=CONNECT_TIMEOUT):
+    """
+    Listens on PORT and connects to the partner at the same time, waiting on
+    both sockets with the selector `sel`. Whichever side becomes ready first
+    wins the race and the other socket is closed.
+    Returns the connected (non-blocking) socket, or None if no connection is
+    made in time. Both rendezvous sockets are unregistered from `sel` on return.
+    """
+    server_sock = open_listener()
+    if server_sock is not None:
+        sel.register(server_sock, selectors.EVENT_READ)
+    conn_sock = None
+    failed_sock = None  # Kept so the next attempt can reuse its descriptor
+    chat_conn = None
+    deadline = time.monotonic() + timeout
+    retry_at = time.monotonic()
+    retry_delay = RETRY_DELAY_MIN
+    try:
+        while chat_conn is None:
+            now = time.monotonic()
+            if now >= deadline:
+                return None
+            if conn_sock is None and now >= retry_at:
+                conn_sock = start_connect(partner_ip, failed_sock)
+                failed_sock = None
+                if conn_sock is None:
+                    retry_at = now + retry_delay
+                    retry_delay = min(retry_delay * 2, RETRY_DELAY_MAX)
+                else:
+                    sel.register(conn_sock, selectors.EVENT_WRITE)
+            wait = deadline - now
+            if conn_sock is None:
+                wait = min(wait, max(retry_at - now, 0))
+
+            for key, _ in sel.select(wait):
+                if key.fileobj is server_sock:
+                    try:
+                        conn, addr = server_sock.accept()
+                    except BlockingIOError:
+                        continue
                     chat_conn = conn
-                    connection_established.set()
                     print(f"[Listener] Incoming connection established from {addr}")
-                else:
-                    # Already have a connection; close the redundant one.
-                    conn.close()
-        except socket.timeout:
-            continue
-        except Exception as e:
-            print(f"[Listener] Error: {e}")
-            break
-    server_sock.close()
+                    break
+                # The outgoing connection attempt has completed; check its outcome.
+                sel.unregister(conn_sock)
+                if conn_sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                    chat_conn, conn_sock = conn_sock, None
+                    print(f"[Connector] Connected to partner at {partner_ip}:{PORT}")
+                    break
+                # Connection not yet available; back off before trying again.
+                failed_sock, conn_sock = conn_sock, None
+                retry_at = time.monotonic() + retry_delay
+                retry_delay = min(retry_delay * 2, RETRY_DELAY_MAX)
+    finally:
+        if server_sock is not None:
+            sel.unregister(server_sock)
+            server_sock.close()
+        if conn_sock is not None:
+            sel.unregister(conn_sock)
+            conn_sock.close()
+        if failed_sock is not None:
+            failed_sock.close()
+
+    # Chat lines are small writes; send them without Nagle delay.
+    chat_conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return chat_conn
 
 
-def client_thread_func(partner_ip):
+def send_frame(sock, send_buffer, tag, *parts):
     """
-    Repeatedly attempts to connect to the partner's IP on PORT.
-    Once connected (and if no connection exists yet), saves the connection
-    and signals that the chat can begin.
+    Sends one message frame: a 5-byte header (1-byte type tag, 4-byte
+    big-endian payload length) followed by the payload, given as one or more
+    byte strings. Everything goes out in a single sendmsg() (writev) call.
+    Whatever the kernel does not take right away (the socket is non-blocking)
+    is queued in `send_buffer`, which chat_session() writes out once the socket
+    is writable again; frames sent while data is queued go behind it.
     """
-    global chat_conn
-    while not connection_established.is_set():
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.settimeout(1)
-            s.connect((partner_ip, PORT))
-            with chat_conn_lock:
-                if chat_conn is None:
-                    chat_conn = s
-                    connection_established.set()
-                    print(f"[Connector] Connected to partner at {partner_ip}:{PORT}")
-                else:
-                    s.close()  # A connection was already set up
-            break
-        except Exception:
-            # Connection not yet available; wait a bit before retrying.
-            time.sleep(1)
+    buffers = [FRAME_HEADER.pack(tag, sum(len(p) for p in parts)), *parts]
+    if send_buffer:
+        send_buffer += b"".join(buffers)
+        return
+    try:
+        sent = sock.sendmsg(buffers)
+    except BlockingIOError:
+        sent = 0
+    if sent < sum(len(b) for b in buffers):
+        send_buffer += b"".join(buffers)[sent:]
 
 
-def send_messages(sock, my_name):
+def flush_send_buffer(sock, send_buffer):
     """
-    Reads user input and sends messages over the connection.
-    Typing 'exit()' notifies the partner and closes the connection.
+    Writes as much of the queued outgoing data as the socket accepts now.
+    Returns False if the connection failed and the chat session should stop.
     """
-    while True:
-        msg = input("")
-        if msg.strip() == "exit()":
-            try:
-                sock.sendall("USER_EXIT".encode())
-            except Exception as e:
-                print("Error sending exit message:", e)
-            print("You have exited the chat.")
-            sock.close()
-            break
-        else:
-            message_to_send = f"{my_name}: {msg}"
-            try:
-                sock.sendall(message_to_send.encode())
-            except Exception as e:
-                print("Error sending message:", e)
-                break
+    try:
+        sent = sock.send(send_buffer)
+    except BlockingIOError:
+        return True
+    except Exception as e:
+        print("Error sending message:", e)
+        return False
+    del send_buffer[:sent]
+    return True
+
+
+def leave_chat(sock, send_buffer):
+    """
+    Notifies the partner that we are leaving the chat, after any queued data.
+    Waits up to EXIT_SEND_TIMEOUT for the partner to accept it.
+    Always returns False so it can end the chat session directly.
+    """
+    send_buffer += EXIT_FRAME
+    try:
+        sock.settimeout(EXIT_SEND_TIMEOUT)
+        sock.sendall(send_buffer)
+        send_buffer.clear()
+    except Exception as e:
+        print("Error sending exit message:", e)
+    print("You have exited the chat.")
+    return False
+
+
+def pop_line(buffer):
+    """
+    Removes the first complete line from `buffer` and returns it without its
+    line ending, or returns None if `buffer` holds no complete line yet.
+    """
+    end = buffer.find(b"\n")
+    if end < 0:
+        return None
+    line = bytes(buffer[:end]).rstrip(b"\r")
+    del buffer[: end + 1]
+    return line
 
 
-def receive_messages(sock):
+def ask(prompt, buffer):
     """
-    Listens for incoming messages.
-    When a 'USER_EXIT' message is received, informs the user that the partner is offline.
+    Shows `prompt` and returns the user's answer: the next line of input, with
+    surrounding whitespace removed. stdin is read with os.read() into `buffer`,
+    as in the chat session, so lines typed ahead stay in `buffer` for the chat.
+    input() would leave them in sys.stdin's own buffer, where select() cannot
+    see them. Raises EOFError if stdin is closed before anything was typed.
+    """
+    print(prompt, end="", flush=True)
+    while b"\n" not in buffer:
+        data = os.read(sys.stdin.fileno(), STDIN_READ_SIZE)
+        if not data:
+            if not buffer:
+                raise EOFError
+            data = b"\n"  # Use the unfinished last line, as input() does.
+        buffer += data
+    return pop_line(buffer).decode("utf-8", "replace").strip()
+
+
+def send_messages(sock, prefix, buffer, send_buffer):
+    """
+    Reads the user input currently available on stdin into `buffer` and sends
+    every complete line (see send_lines()).
+    Returns False once the chat session should stop.
+    """
+    data = os.read(sys.stdin.fileno(), STDIN_READ_SIZE)
+    if not data:
+        # stdin was closed: finish any partial line, then leave as if exit() was typed.
+        data = (b"\n" if buffer else b"") + EXIT_COMMAND + b"\n"
+    buffer += data
+    return send_lines(sock, prefix, buffer, send_buffer)
+
+
+def send_lines(sock, prefix, buffer, send_buffer):
+    """
+    Sends every complete line in `buffer` over the connection, preceded by
+    `prefix` (the encoded "name: " header, built once per session). Data the
+    socket cannot take yet is queued in `send_buffer` (see send_frame()).
+    A line reading 'exit()' notifies the partner and ends the chat.
+    Returns False once the chat session should stop.
+
+    The connection has TCP_NODELAY set, so every send goes out as its own
+    packet: keep each message to a single write. send_frame() hands the header,
+    prefix and message to the kernel together so they leave as one segment.
     """
     while True:
+        line = pop_line(buffer)
+        if line is None:
+            return True
+        if line.strip() == EXIT_COMMAND:
+            return leave_chat(sock, send_buffer)
+        if len(prefix) + len(line) > MAX_FRAME_SIZE:
+            print(f"Message not sent: longer than {MAX_FRAME_SIZE} bytes.")
+            continue
         try:
-            data = sock.recv(1024)
-            if not data:
-                print("Connection closed by the partner.")
-                break
-            msg = data.decode()
-            if msg == "USER_EXIT":
-                print("The partner has exited the chat. They are offline.")
-                break
-            print(msg)
+            send_frame(sock, send_buffer, MSG_TEXT, prefix, line)
         except Exception as e:
-            print("Error receiving message:", e)
+            print("Error sending message:", e)
+            return False
+
+
+class ReceiveBuffer:
+    """
+    Fixed-size buffer that received data is read into in place with recv_into().
+    It only grows, by doubling, once it is filled by a single frame that is
+    still incomplete, so its size follows the data that actually arrived.
+    """
+
+    def __init__(self, size=RECV_SIZE):
+        self.data = bytearray(size)
+        self.view = memoryview(self.data)
+        self.filled = 0  # Number of bytes at the start of `data` holding input
+
+    def consume(self, count):
+        """Drops the first `count` bytes, moving any partial frame to the front."""
+        remaining = self.filled - count
+        if count and remaining:
+            self.view[:remaining] = self.view[count : self.filled]
+        self.filled = remaining
+        if remaining == len(self.data):
+            # receive_messages() has checked the frame against MAX_FRAME_SIZE.
+            size = min(len(self.data) * 2, FRAME_HEADER.size + MAX_FRAME_SIZE)
+            data = bytearray(size)
+            data[:remaining] = self.view[:remaining]
+            self.view.release()
+            self.data, self.view = data, memoryview(data)
+
+
+def receive_messages(sock, buffer):
+    """
+    Reads the data currently available on the connection into `buffer` (a
+    ReceiveBuffer) and handles every complete frame in it; a partial frame
+    stays buffered until the rest arrives. When an exit frame is received,
+    informs the user that the partner is offline; a frame with an unknown
+    type tag or a length above MAX_FRAME_SIZE means the peer does not speak
+    this protocol, and ends the chat.
+    Returns False once the chat session should stop.
+    """
+    try:
+        received = sock.recv_into(buffer.view[buffer.filled :])
+    except BlockingIOError:
+        # Spurious wakeup; nothing to read yet.
+        return True
+    except Exception as e:
+        print("Error receiving message:", e)
+        return False
+    if not received:
+        print("Connection closed by the partner.")
+        return False
+    if hasattr(socket, "TCP_QUICKACK"):
+        # Linux clears this after each ACK; re-arm it so replies are not delayed.
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+    buffer.filled += received
+    view = buffer.view
+    start = 0
+    lines = []
+    running = True
+    while buffer.filled - start >= FRAME_HEADER.size:
+        tag, length = FRAME_HEADER.unpack_from(view, start)
+        if tag not in (MSG_TEXT, MSG_EXIT):
+            # Not our framing, e.g. an older chat.py or chat2.py on the same PORT.
+            lines.append("Received an invalid message; closing the connection.")
+            running = False
+            break
+        if length > MAX_FRAME_SIZE:
+            lines.append("Received an oversized message; closing the connection.")
+            running = False
+            break
+        end = start + FRAME_HEADER.size + length
+        if end > buffer.filled:
+            break
+        if tag == MSG_EXIT:
+            lines.append("The partner has exited the chat. They are offline.")
+            running = False
             break
+        lines.append(str(view[start + FRAME_HEADER.size : end], "utf-8", "replace"))
+        start = end
+    if running:
+        buffer.consume(start)
+    if lines:
+        # One write for the whole batch; chat_session() flushes when idle.
+        sys.stdout.write("\n".join(lines) + "\n")
+    return running
+
+
+def handle_socket(sock, recv_buffer, send_buffer, mask):
+    """
+    Handles readiness on the chat socket: writes queued outgoing data when it
+    is writable and reads incoming frames when it is readable.
+    Returns False once the chat session should stop.
+    """
+    if mask & selectors.EVENT_WRITE and not flush_send_buffer(sock, send_buffer):
+        return False
+    if mask & selectors.EVENT_READ:
+        return receive_messages(sock, recv_buffer)
+    return True
 
 
-def chat_session(sock, my_name):
+def restore_stdout(line_buffering):
     """
-    Starts the chat session by launching two threads:
-    one for sending messages and one for receiving messages.
+    Restores stdout's line buffering after the chat session. This flushes
+    stdout, so a terminal that has gone away is reported on stderr here
+    instead of raising.
     """
-    send_thread = threading.Thread(target=send_messages, args=(sock, my_name))
-    recv_thread = threading.Thread(target=receive_messages, args=(sock,))
-    send_thread.start()
-    recv_thread.start()
-    send_thread.join()
-    recv_thread.join()
+    try:
+        sys.stdout.reconfigure(line_buffering=line_buffering)
+    except OSError as e:
+        print("Error writing to the terminal:", e, file=sys.stderr)
+
+
+def chat_session(sel, sock, my_name, stdin_buffer):
+    """
+    Runs the chat session on the selector `sel`, a single-threaded loop that
+    waits on both user input (stdin) and the socket, dispatching to the
+    matching handler. Each handler only reads what select() reported as ready,
+    so neither can stall the other. `stdin_buffer` holds any input already
+    read from stdin (see ask()); its complete lines are sent first.
+    If stdin is a regular file, which cannot be waited on, its lines are all
+    sent straight away instead; reading a file never blocks.
+    Ctrl+C or SIGTERM wakes the loop through a pipe registered on the same
+    selector, so the partner is told we left and cleanup still runs.
+    Output is written to stdout without line buffering and flushed whenever
+    no more input is ready, so a burst of messages costs one flush.
+    """
+    prefix = f"{my_name}: ".encode("utf-8")
+    recv_buffer = ReceiveBuffer()
+    send_buffer = bytearray()
+    # stdin stays blocking: it shares its open file description with the
+    # terminal's stdout, and os.read() only runs once select() reports input.
+    stdin_fd = sys.stdin.fileno()
+    # Each setup step schedules its undo on `cleanup` as soon as it is done, so
+    # a failure part-way through still unwinds the steps before it.
+    with contextlib.ExitStack() as cleanup:
+        # Registered first so that it runs last, as it may fail (see below).
+        cleanup.callback(restore_stdout, sys.stdout.line_buffering)
+        cleanup.enter_context(sock)
+        sock.setblocking(False)
+        wakeup_r, wakeup_w = os.pipe()
+        cleanup.callback(os.close, wakeup_r)
+        cleanup.callback(os.close, wakeup_w)
+        os.set_blocking(wakeup_r, False)
+        os.set_blocking(wakeup_w, False)
+        cleanup.callback(signal.set_wakeup_fd, signal.set_wakeup_fd(wakeup_w))
+        for sig in EXIT_SIGNALS:
+            old_handler = signal.signal(sig, lambda signum, frame: None)
+            cleanup.callback(signal.signal, sig, old_handler)
+        sel.register(
+            wakeup_r, selectors.EVENT_READ, lambda mask: leave_chat(sock, send_buffer)
+        )
+        cleanup.callback(sel.unregister, wakeup_r)
+        sock_key = sel.register(
+            sock,
+            selectors.EVENT_READ,
+            lambda mask: handle_socket(sock, recv_buffer, send_buffer, mask),
+        )
+        cleanup.callback(sel.unregister, sock)
+        try:
+            sel.register(
+                stdin_fd,
+                selectors.EVENT_READ,
+                lambda mask: send_messages(sock, prefix, stdin_buffer, send_buffer),
+            )
+        except PermissionError:
+            # epoll refuses regular files (EPERM).
+            while send_messages(sock, prefix, stdin_buffer, send_buffer):
+                pass
+            return
+        cleanup.callback(sel.unregister, stdin_fd)
+        if not send_lines(sock, prefix, stdin_buffer, send_buffer):
+            return
+        # Output is flushed once the loop goes idle rather than after every line.
+        sys.stdout.reconfigure(line_buffering=False)
+        output_pending = False
+        while True:
+            # While output is pending, poll without blocking and flush only
+            # once nothing else is ready.
+            events = sel.select(0) if output_pending else None
+            if not events:
+                if output_pending:
+                    sys.stdout.flush()
+                    output_pending = False
+                events = sel.select()
+            for key, mask in events:
+                if not key.data(mask):
+                    return
+            # Any of the handlers may have written to stdout.
+            output_pending = True
+            # Wait for the socket to become writable only while data is queued.
+            wanted = selectors.EVENT_READ
+            if send_buffer:
+                wanted |= selectors.EVENT_WRITE
+            if sock_key.events != wanted:
+                sock_key = sel.modify(sock, wanted, sock_key.data)
 
 
 def main():
     print("Welcome to the P2P Chat App!")
-    my_name = input("Enter your name: ").strip()
+    # All user input is read through this buffer; see ask().
+    stdin_buffer = bytearray()
+    my_name = ask("Enter your name: ", stdin_buffer)
 
     # Get partner configuration (name and IP) from saved file or prompt user.
     config = load_config()
     if config:
-        use_config = input("Saved configuration found. Use it? (Y/N): ").strip().lower()
+        use_config = ask(
+            "Saved configuration found. Use it? (Y/N): ", stdin_buffer
+        ).lower()
         if use_config == "y":
             partner_name = config.get("partner_name")
             partner_ip = config.get("partner_ip")
@@ -187,36 +613,28 @@ def main():
                 f"Using saved configuration: Partner Name: {partner_name}, IP: {partner_ip}"
             )
         else:
-            partner_name = input("Enter your partner's name: ").strip()
-            partner_ip = input("Enter your partner's IP address: ").strip()
+            partner_name = ask("Enter your partner's name: ", stdin_buffer)
+            partner_ip = ask("Enter your partner's IP address: ", stdin_buffer)
     else:
-        partner_name = input("Enter your partner's name: ").strip()
-        partner_ip = input("Enter your partner's IP address: ").strip()
-
-    # Start both the listener and connector threads.
-    listener = threading.Thread(target=server_thread_func, daemon=True)
-    connector = threading.Thread(
-        target=client_thread_func, args=(partner_ip,), daemon=True
-    )
-    listener.start()
-    connector.start()
-
-    # Wait for connection established event with a timeout.
-    if not connection_established.wait(timeout=60):
-        print(
-            "Unable to establish connection. Please check the partner's IP address and try again."
-        )
-        return
+        partner_name = ask("Enter your partner's name: ", stdin_buffer)
+        partner_ip = ask("Enter your partner's IP address: ", stdin_buffer)
 
-    # Save configuration only if connection is successfully established.
-    save_config(partner_name, partner_ip)
+    # One selector drives the whole app: first the rendezvous, then the chat.
+    with selectors.DefaultSelector() as sel:
+        # Listen and connect at the same time; the first connection wins.
+        chat_conn = establish_connection(sel, partner_ip)
+        if chat_conn is None:
+            print(
+                "Unable to establish connection. Please check the partner's IP address and try again."
+            )
+            return
 
-    print("Chat connection established. You can start messaging now.")
-    chat_session(chat_conn, my_name)
+        # Save configuration only if connection is successfully established.
+        save_config(partner_name, partner_ip, cached=config)
 
-    # (Optional) Wait for the listener and connector threads to finish.
-    listener.join()
-    connector.join()
+        pin_to_cpu(chat_conn)
+        print("Chat connection established. You can start messaging now.")
+        chat_session(sel, chat_conn, my_name, stdin_buffer)
 
 
 if __name__ == "__main__":
@@ -1,14 +1,22 @@
+import os
 import socket
 
 # Replace with the server VM's IP address
 SERVER_IP = "192.168.1.100"
 PORT = 5000
 
+# Optional explicit socket buffer size in bytes; unset keeps kernel autotuning.
+BUFFER_SIZE = int(os.environ.get("CHAT_SOCKET_BUFFER", "0"))
+
 with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
+    if BUFFER_SIZE:
+        client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, BUFFER_SIZE)
+        client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, BUFFER_SIZE)
     client_socket.connect((SERVER_IP, PORT))
+    client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
     message = "Hello from Client!"
     client_socket.sendall(message.encode())
 
     # Wait for the server's response
-    data = client_socket.recv(1024)
+    data = client_socket.recv(65536)
     print(f"Received from server: {data.decode()}")
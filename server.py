@@ -1,22 +1,34 @@
+import os
 import socket
 
 # Listen on all available interfaces on port 5000
 HOST = ""
 PORT = 5000
 
+# Optional explicit socket buffer size in bytes; unset keeps kernel autotuning.
+BUFFER_SIZE = int(os.environ.get("CHAT_SOCKET_BUFFER", "0"))
+
 with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
+    if BUFFER_SIZE:
+        # Accepted connections inherit these from the listening socket.
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, BUFFER_SIZE)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, BUFFER_SIZE)
     server_socket.bind((HOST, PORT))
     server_socket.listen()
     print(f"Server is listening on port {PORT}...")
 
     # Wait for a connection
     connection, client_address = server_socket.accept()
+    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
     with connection:
         print(f"Connected by {client_address}")
         while True:
-            data = connection.recv(1024)
+            data = connection.recv(65536)
             if not data:
                 break  # Client closed connection
+            if hasattr(socket, "TCP_QUICKACK"):
+                # Acknowledge right away rather than waiting for the response.
+                connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
             message = data.decode()
             print(f"Received from client: {message}")
 